@@ -0,0 +1,465 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+import copy
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+
+# Out-of-core versions of the historical flood analytics (annual peaks,
+# flood-period statistics, volumes and events). Archives are streamed in
+# chunks, each partition is reduced to a small per-station aggregate and the
+# aggregates are merged, so memory does not grow with the archive length.
+
+FLOOD_PERIODS = {
+    2014: ('2014-09-06', '2014-09-16'),
+    2022: ('2022-07-15', '2022-08-15'),
+    2023: ('2023-07-15', '2023-08-15')
+}
+
+CUBIC_FEET_PER_MAF = 43560 * 1e6
+
+# Longest interval between two readings that still counts as continuous flow.
+# The historical sheets only cover the monsoon months of each year, and the
+# off-season gaps must not be booked as volume or joined into one event.
+MAX_GAP = '2D'
+
+
+# Reading archives in chunks
+def _normalize_chunk(chunk):
+    """Map a raw chunk onto the date / inflow / structure columns of load_barrage_data"""
+    chunk.columns = chunk.columns.astype(str).str.strip().str.lower()
+
+    column_mapping = {}
+    for col in chunk.columns:
+        if 'date' in col:
+            column_mapping[col] = 'date'
+        elif 'inflow' in col:
+            column_mapping[col] = 'inflow'
+        elif 'structure' in col or 'barrage' in col:
+            column_mapping[col] = 'structure'
+    chunk = chunk.rename(columns=column_mapping)
+
+    for col in ['date', 'inflow']:
+        if col not in chunk.columns:
+            raise ValueError(f"Missing required column: {col}")
+    if 'structure' not in chunk.columns:
+        chunk['structure'] = 'Unknown'
+
+    chunk = chunk[['date', 'inflow', 'structure']].copy()
+    # Partition files hold ISO dates, dashboard exports use day-first dates
+    dates = pd.to_datetime(chunk['date'], format='ISO8601', errors='coerce')
+    if dates.isna().any():
+        dates = dates.fillna(pd.to_datetime(chunk['date'].where(dates.isna()), dayfirst=True, errors='coerce'))
+    chunk['date'] = dates
+    # Dashboard exports carry thousands separators, e.g. '1,085,750'
+    chunk['inflow'] = pd.to_numeric(chunk['inflow'].astype(str).str.replace(',', ''), errors='coerce')
+    # Blank station cells are kept as 'Unknown' rather than dropped by groupby
+    structure = chunk['structure'].fillna('Unknown').astype(str).str.strip()
+    chunk['structure'] = structure.mask(structure == '', 'Unknown')
+
+    return chunk.dropna(subset=['date', 'inflow'])
+
+
+def _iter_excel_rows(file_path, sheet_name, chunksize):
+    # pd.read_excel has no chunksize, so stream the sheet with openpyxl
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(file_path, read_only=True, data_only=True)
+    try:
+        sheet = workbook[sheet_name] if isinstance(sheet_name, str) else workbook.worksheets[sheet_name]
+        rows = sheet.iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) == chunksize:
+                yield pd.DataFrame(batch, columns=header)
+                batch = []
+        if batch:
+            yield pd.DataFrame(batch, columns=header)
+    finally:
+        workbook.close()
+
+
+def read_chunks(source, sheet_name=0, chunksize=100_000):
+    """
+    Stream a CSV or Excel archive as normalized chunks
+
+    Parameters:
+    - source: Path to a .csv or .xlsx file
+    - sheet_name: Sheet name or index (Excel only)
+    - chunksize: Number of rows per chunk
+
+    Yields:
+    - DataFrames with date, inflow and structure columns
+    """
+    if str(source).lower().endswith('.csv'):
+        # Only blank cells are missing, a station may well be called 'NA'
+        chunks = pd.read_csv(source, chunksize=chunksize, keep_default_na=False, na_values=[''])
+    else:
+        chunks = _iter_excel_rows(source, sheet_name, chunksize)
+
+    for chunk in chunks:
+        chunk = _normalize_chunk(chunk)
+        if not chunk.empty:
+            yield chunk
+
+
+def _partition_path(out_dir, by, key, used):
+    # Only [A-Za-z0-9_-] is safe in file names on every platform, and file
+    # names are case-insensitive on Windows, so keep a suffix for clashes
+    name = re.sub(r'[^A-Za-z0-9_-]', '_', str(key))
+    stem, suffix = f"{by}_{name}", 1
+    while stem.lower() in used:
+        suffix += 1
+        stem = f"{by}_{name}_{suffix}"
+    used.add(stem.lower())
+    return os.path.join(out_dir, f"{stem}.csv")
+
+
+def partition_archive(source, out_dir, by='year', sheet_name=0, chunksize=100_000,
+                      drop_duplicates=False):
+    """
+    Split an archive into one CSV per year or per station
+
+    The archive is streamed once; afterwards each partition, which is small
+    enough to hold in memory, is sorted by structure and date so the
+    partitions can be summarized in a stream.
+
+    Parameters:
+    - source: Path to a .csv or .xlsx file
+    - out_dir: Directory for the partition files
+    - by: 'year' or 'station'
+    - drop_duplicates: Keep only the last reading of a station per timestamp.
+      Off by default, since the sheets hold real readings sharing a date.
+
+    Returns:
+    - Sorted list of partition file paths
+    """
+    if by not in ('year', 'station'):
+        raise ValueError(f"Unknown partition key: {by}")
+    os.makedirs(out_dir, exist_ok=True)
+
+    paths = {}
+    used = set()
+    for chunk in read_chunks(source, sheet_name=sheet_name, chunksize=chunksize):
+        keys = chunk['date'].dt.year if by == 'year' else chunk['structure']
+        for key, part in chunk.groupby(keys):
+            first = key not in paths
+            if first:
+                paths[key] = _partition_path(out_dir, by, key, used)
+            # Dates are written in ISO format so read_chunks can parse them back
+            part.to_csv(paths[key], mode='w' if first else 'a', header=first, index=False)
+
+    dropped = 0
+    for path in paths.values():
+        part = pd.read_csv(path, parse_dates=['date'], dtype={'structure': str}, keep_default_na=False)
+        part = part.sort_values(['structure', 'date'], kind='stable')
+        if drop_duplicates:
+            rows = len(part)
+            part = part.drop_duplicates(['structure', 'date'], keep='last')
+            dropped += rows - len(part)
+        part.to_csv(path, index=False)
+
+    if drop_duplicates:
+        print(f"Dropped {dropped} duplicate readings")
+
+    return sorted(paths.values())
+
+
+# Mergeable per-station aggregates
+class StationAggregate:
+    """
+    Partial analytics for one station over a contiguous stretch of time
+
+    Two aggregates covering consecutive, non-overlapping stretches can be
+    combined with merge(); the interval between them is accounted for in
+    the volumes and an event spanning the boundary is joined back up.
+
+    Parameters:
+    - threshold: Inflow (cusecs) at or above which a reading is part of an
+      event. No events are tracked when None.
+    - flood_periods: Dictionary of year -> (start, end) as in FLOOD_PERIODS
+    - max_gap: Longest interval between readings that is booked as volume
+      or kept within one event, see MAX_GAP. None disables the limit.
+    """
+
+    def __init__(self, threshold=None, flood_periods=None, max_gap=MAX_GAP):
+        self.threshold = threshold
+        self.flood_periods = FLOOD_PERIODS if flood_periods is None else flood_periods
+        self.max_gap = None if max_gap is None else pd.Timedelta(max_gap)
+        self.first = None      # (date, inflow) of the earliest reading
+        self.last = None       # (date, inflow) of the latest reading
+        self.count = 0
+        self.peaks = {}        # year -> (peak inflow, date)
+        self.volumes = {}      # year -> cubic feet
+        self.flood = {}        # flood year -> [count, sum, peak, peak date]
+        self.events = []       # [start, end, peak, peak date]
+
+    @classmethod
+    def from_series(cls, dates, inflows, threshold=None, flood_periods=None, max_gap=MAX_GAP):
+        """Build an aggregate from time-sorted readings of a single station"""
+        agg = cls(threshold=threshold, flood_periods=flood_periods, max_gap=max_gap)
+        dates = pd.DatetimeIndex(dates)
+        inflows = np.asarray(inflows, dtype=float)
+        if len(inflows) == 0:
+            return agg
+
+        agg.first = (dates[0], inflows[0])
+        agg.last = (dates[-1], inflows[-1])
+        agg.count = len(inflows)
+
+        years = dates.year
+        for year in np.unique(years):
+            idx = np.flatnonzero(years == year)
+            peak = idx[np.argmax(inflows[idx])]
+            agg.peaks[int(year)] = (inflows[peak], dates[peak])
+
+        # Intervals longer than max_gap break the record, e.g. the off-season
+        seconds = np.asarray((dates[1:] - dates[:-1]).total_seconds())
+        continuous = agg._continuous(seconds)
+
+        # Trapezoidal volume, each interval booked to the year it ends in
+        if len(inflows) > 1:
+            volume = np.where(continuous, seconds * (inflows[1:] + inflows[:-1]) / 2, 0.0)
+            end_years = years[1:]
+            for year in np.unique(end_years):
+                agg.volumes[int(year)] = float(volume[end_years == year].sum())
+
+        for year, (start, end) in agg.flood_periods.items():
+            mask = (dates >= pd.Timestamp(start)) & (dates <= pd.Timestamp(end))
+            if mask.any():
+                values = inflows[mask]
+                peak = np.argmax(values)
+                agg.flood[year] = [int(mask.sum()), float(values.sum()), values[peak], dates[mask][peak]]
+
+        if threshold is not None:
+            above = inflows >= threshold
+            linked = above[:-1] & above[1:] & continuous
+            starts = np.flatnonzero(above & ~np.concatenate([[False], linked]))
+            stops = np.flatnonzero(above & ~np.concatenate([linked, [False]])) + 1
+            for start, stop in zip(starts, stops):
+                peak = start + np.argmax(inflows[start:stop])
+                agg.events.append([dates[start], dates[stop - 1], inflows[peak], dates[peak]])
+
+        return agg
+
+    def _continuous(self, seconds):
+        if self.max_gap is None:
+            return np.ones(len(seconds), dtype=bool)
+        return seconds <= self.max_gap.total_seconds()
+
+    def merge(self, other):
+        """Append an aggregate covering the stretch right after this one"""
+        if other.first is None:
+            return self
+        if self.first is None:
+            self.__dict__.update(copy.deepcopy(other.__dict__))
+            return self
+        if other.first[0] < self.last[0]:
+            raise ValueError(
+                f"Readings are not in time order: {other.first[0]} < {self.last[0]}; "
+                "split unsorted archives with partition_archive first"
+            )
+
+        for year, (peak, date) in other.peaks.items():
+            if year not in self.peaks or peak > self.peaks[year][0]:
+                self.peaks[year] = (peak, date)
+
+        for year, volume in other.volumes.items():
+            self.volumes[year] = self.volumes.get(year, 0.0) + volume
+        seconds = (other.first[0] - self.last[0]).total_seconds()
+        continuous = self._continuous(np.array([seconds]))[0]
+        if continuous:
+            bridge_year = other.first[0].year
+            self.volumes[bridge_year] = (
+                self.volumes.get(bridge_year, 0.0) + seconds * (self.last[1] + other.first[1]) / 2
+            )
+
+        for year, (count, total, peak, date) in other.flood.items():
+            if year not in self.flood:
+                self.flood[year] = [count, total, peak, date]
+                continue
+            stats = self.flood[year]
+            stats[0] += count
+            stats[1] += total
+            if peak > stats[2]:
+                stats[2], stats[3] = peak, date
+
+        events = [list(event) for event in other.events]
+        if (continuous and self.events and events
+                and self.events[-1][1] == self.last[0]
+                and events[0][0] == other.first[0]):
+            # The event runs across the boundary between the two stretches
+            joined = self.events[-1]
+            start, end, peak, date = events.pop(0)
+            joined[1] = end
+            if peak > joined[2]:
+                joined[2], joined[3] = peak, date
+        self.events.extend(events)
+
+        self.last = other.last
+        self.count += other.count
+        return self
+
+
+class ArchiveAggregate:
+    """
+    Partial analytics for all stations of one partition
+
+    Parameters:
+    - threshold: Event threshold in cusecs, see StationAggregate
+    - flood_periods: Dictionary of year -> (start, end) as in FLOOD_PERIODS
+    - max_gap: Longest continuous interval, see StationAggregate
+    """
+
+    def __init__(self, threshold=None, flood_periods=None, max_gap=MAX_GAP):
+        self.threshold = threshold
+        self.flood_periods = flood_periods
+        self.max_gap = max_gap
+        self.stations = {}
+
+    def update(self, chunk):
+        """Fold the next normalized chunk of this partition into the aggregate"""
+        chunk = chunk.sort_values(['structure', 'date'], kind='stable')
+        for structure, part in chunk.groupby('structure', sort=False):
+            partial = StationAggregate.from_series(
+                part['date'], part['inflow'],
+                threshold=self.threshold, flood_periods=self.flood_periods, max_gap=self.max_gap
+            )
+            if structure in self.stations:
+                self.stations[structure].merge(partial)
+            else:
+                self.stations[structure] = partial
+        return self
+
+    # Results, in the same shape as the in-memory notebook analyses
+    def annual_peaks(self):
+        rows = [
+            {'structure': structure, 'year': year, 'peak_inflow': peak, 'peak_inflow_date': date}
+            for structure, agg in self.stations.items()
+            for year, (peak, date) in sorted(agg.peaks.items())
+        ]
+        return pd.DataFrame(rows, columns=['structure', 'year', 'peak_inflow', 'peak_inflow_date'])
+
+    def flood_period_stats(self):
+        rows = [
+            {
+                'structure': structure,
+                'year': year,
+                'records': count,
+                'avg_inflow_flood': total / count,
+                'peak_inflow': peak,
+                'peak_inflow_date': date,
+            }
+            for structure, agg in self.stations.items()
+            for year, (count, total, peak, date) in sorted(agg.flood.items())
+        ]
+        return pd.DataFrame(
+            rows,
+            columns=['structure', 'year', 'records', 'avg_inflow_flood', 'peak_inflow', 'peak_inflow_date']
+        )
+
+    def volumes(self):
+        rows = [
+            {'structure': structure, 'year': year, 'volume_cft': volume, 'volume_maf': volume / CUBIC_FEET_PER_MAF}
+            for structure, agg in self.stations.items()
+            for year, volume in sorted(agg.volumes.items())
+        ]
+        return pd.DataFrame(rows, columns=['structure', 'year', 'volume_cft', 'volume_maf'])
+
+    def events(self):
+        rows = [
+            {'structure': structure, 'start': start, 'end': end, 'peak_inflow': peak, 'peak_inflow_date': date}
+            for structure, agg in self.stations.items()
+            for start, end, peak, date in agg.events
+        ]
+        return pd.DataFrame(rows, columns=['structure', 'start', 'end', 'peak_inflow', 'peak_inflow_date'])
+
+
+def merge_aggregates(aggregates):
+    """
+    Merge partition aggregates into one
+
+    Partitions may be given in any order; each station's pieces are joined
+    in time order. Pieces of one station must not overlap in time.
+    """
+    aggregates = list(aggregates)
+    merged = ArchiveAggregate()
+    if not aggregates:
+        return merged
+    merged.threshold = aggregates[0].threshold
+    merged.flood_periods = aggregates[0].flood_periods
+    merged.max_gap = aggregates[0].max_gap
+
+    pieces = {}
+    for agg in aggregates:
+        for structure, station in agg.stations.items():
+            if station.first is not None:
+                pieces.setdefault(structure, []).append(station)
+
+    for structure, stations in pieces.items():
+        stations.sort(key=lambda station: station.first[0])
+        combined = StationAggregate(
+            threshold=merged.threshold, flood_periods=merged.flood_periods, max_gap=merged.max_gap
+        )
+        for station in stations:
+            combined.merge(station)
+        merged.stations[structure] = combined
+
+    return merged
+
+
+# Running partitions
+def summarize_source(source, sheet_name=0, chunksize=100_000, threshold=None, flood_periods=None,
+                     max_gap=MAX_GAP):
+    """Stream one partition file into an ArchiveAggregate"""
+    agg = ArchiveAggregate(threshold=threshold, flood_periods=flood_periods, max_gap=max_gap)
+    for chunk in read_chunks(source, sheet_name=sheet_name, chunksize=chunksize):
+        agg.update(chunk)
+    return agg
+
+
+def summarize_archive(sources, sheet_name=0, chunksize=100_000, threshold=None,
+                      flood_periods=None, max_gap=MAX_GAP, workers=1):
+    """
+    Run the flood analytics over many partitions with bounded memory
+
+    Parameters:
+    - sources: Partition files, e.g. the output of partition_archive
+    - sheet_name: Sheet name or index (Excel only)
+    - chunksize: Number of rows held in memory per partition at a time
+    - threshold: Event threshold in cusecs
+    - flood_periods: Dictionary of year -> (start, end), defaults to FLOOD_PERIODS
+    - max_gap: Longest interval booked as volume or kept within one event
+    - workers: Number of processes; partitions are read in parallel when > 1
+
+    Returns:
+    - ArchiveAggregate for the whole archive
+
+    Example:
+        paths = partition_archive("data/historicalFlood.xlsx", "results/partitions",
+                                  sheet_name="Trimmu_Panjnad")
+        archive = summarize_archive(paths, threshold=400000, workers=4)
+        archive.annual_peaks()
+    """
+    sources = list(sources)
+    options = dict(sheet_name=sheet_name, chunksize=chunksize,
+                   threshold=threshold, flood_periods=flood_periods, max_gap=max_gap)
+
+    if workers > 1 and len(sources) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(summarize_source, source, **options) for source in sources]
+            aggregates = [future.result() for future in futures]
+    else:
+        aggregates = [summarize_source(source, **options) for source in sources]
+
+    return merge_aggregates(aggregates)
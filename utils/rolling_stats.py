@@ -0,0 +1,277 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+import math
+import numbers
+from collections import deque
+from datetime import timedelta
+
+import numpy as np
+import pandas as pd
+
+
+# Rolling statistics kept per station, updated one reading at a time
+class RollingWindow:
+    """
+    Rolling window over the readings of a single station
+
+    Every reading is pushed once and evicted once, so mean, sum, max and
+    rate-of-rise are all available in O(1) (amortised) after each update.
+
+    Parameters:
+    - window: Number of readings (int, e.g. 7 as in rolling(7)) or a time
+      span understood by pd.Timedelta (e.g. '24h', '72h', '7D'). Time
+      windows cover (t - window, t], the same as pandas time-based rolling.
+    - min_periods: Minimum number of non-missing readings for a result,
+      otherwise NaN. Defaults as in pandas: the window size for reading
+      counts and 1 for time spans. Missing readings take up a row of a
+      count window, as they do in rolling(7).
+    """
+
+    def __init__(self, window, min_periods=None):
+        # pd.Timedelta passes the Integral check, so test for spans first
+        if isinstance(window, (str, timedelta, np.timedelta64)):
+            self.size = None
+            self.span = pd.Timedelta(window)
+            if self.span <= pd.Timedelta(0):
+                raise ValueError(f"Window span must be positive: {window}")
+        elif isinstance(window, numbers.Integral) and not isinstance(window, bool):
+            if window < 1:
+                raise ValueError(f"Window size must be positive: {window}")
+            self.size = int(window)
+            self.span = None
+        else:
+            # pd.Timedelta(7.0) would silently mean 7 nanoseconds
+            raise TypeError(f"Window must be a reading count or a time span: {window!r}")
+
+        if min_periods is None:
+            min_periods = self.size if self.size is not None else 1
+        if min_periods < 0 or (self.size is not None and min_periods > self.size):
+            raise ValueError(f"min_periods out of range for window {window}: {min_periods}")
+
+        self.label = str(window)
+        self.min_periods = min_periods
+        self._buffer = deque()   # (row, timestamp, value) of non-missing readings
+        self._maxima = deque()   # (row, value) with decreasing values
+        self._sum = 0.0
+        self._rows = 0
+        self._last_time = None
+
+    def update(self, timestamp, value):
+        """Add a reading and evict everything that fell out of the window"""
+        timestamp = pd.Timestamp(timestamp)
+        if self._last_time is not None and timestamp < self._last_time:
+            raise ValueError(
+                f"Readings must arrive in time order: {timestamp} < {self._last_time}"
+            )
+        self._last_time = timestamp
+
+        row = self._rows
+        self._rows += 1
+        if not pd.isna(value):
+            value = float(value)
+            self._buffer.append((row, timestamp, value))
+            self._sum += value
+            while self._maxima and self._maxima[-1][1] <= value:
+                self._maxima.pop()
+            self._maxima.append((row, value))
+
+        buffer = self._buffer
+        while buffer and (
+            (self.size is not None and buffer[0][0] <= row - self.size)
+            or (self.span is not None and buffer[0][1] <= timestamp - self.span)
+        ):
+            first, _, value = buffer.popleft()
+            self._sum -= value
+            if self._maxima and self._maxima[0][0] == first:
+                self._maxima.popleft()
+
+        # Reset the running sum so float drift cannot build up forever
+        if not buffer:
+            self._sum = 0.0
+
+    def _view(self, now):
+        """
+        Return (count, sum, max, first, last) of the window as of now
+
+        The buffers are left untouched, so a query never stops the station
+        from taking its next reading. Readings older than the window are
+        skipped on the fly, which costs one step per reading that aged out
+        since the last update.
+        """
+        buffer = self._buffer
+        skip = 0
+        total = self._sum
+        if self.span is not None and now is not None:
+            cutoff = pd.Timestamp(now) - self.span
+            while skip < len(buffer) and buffer[skip][1] <= cutoff:
+                total -= buffer[skip][2]
+                skip += 1
+
+        count = len(buffer) - skip
+        if count == 0:
+            return 0, 0.0, math.nan, None, None
+
+        first = buffer[skip]
+        peak = next(value for row, value in self._maxima if row >= first[0])
+        return count, total, peak, first, buffer[-1]
+
+    def stats(self, now=None):
+        """
+        Return the statistics keyed as '<stat>_<window>'
+
+        Parameters:
+        - now: Time to evaluate time windows at, defaults to the last reading
+        """
+        count, total, peak, first, last = self._view(now)
+        if count == 0 or count < self.min_periods:
+            mean = total = peak = rise = math.nan
+        else:
+            mean = total / count
+            # Change between the oldest and newest reading, in cusecs per hour
+            hours = (last[1] - first[1]).total_seconds() / 3600
+            rise = (last[2] - first[2]) / hours if hours > 0 else math.nan
+
+        return {
+            f'mean_{self.label}': mean,
+            f'sum_{self.label}': total,
+            f'max_{self.label}': peak,
+            f'rise_{self.label}': rise,
+        }
+
+    @property
+    def count(self):
+        return self._view(None)[0]
+
+    @property
+    def sum(self):
+        return self.stats()[f'sum_{self.label}']
+
+    @property
+    def mean(self):
+        return self.stats()[f'mean_{self.label}']
+
+    @property
+    def max(self):
+        return self.stats()[f'max_{self.label}']
+
+    @property
+    def rate_of_rise(self):
+        return self.stats()[f'rise_{self.label}']
+
+
+class RollingStats:
+    """
+    Rolling statistics for many stations and windows at once
+
+    Parameters:
+    - windows: Window definitions accepted by RollingWindow
+    - min_periods: Passed on to every RollingWindow
+
+    Example:
+        rolling = RollingStats(windows=['24h', '72h', '7D'])
+        rolling.update_frame(df, value_col='Outflow_Discharge')
+        rolling.snapshot()
+    """
+
+    def __init__(self, windows=('24h', '72h', '7D'), min_periods=None):
+        self.windows = list(windows)
+        self.min_periods = min_periods
+        self._stations = {}
+        self._last_time = {}
+        self._latest = None
+
+    def _check_order(self, station, timestamp):
+        last = self._last_time.get(station)
+        if last is not None and timestamp < last:
+            raise ValueError(
+                f"Readings of {station} must arrive in time order: {timestamp} < {last}"
+            )
+
+    def update(self, station, timestamp, value):
+        """
+        Push one reading for a station
+
+        Returns:
+        - Dictionary with the station's statistics after this reading
+        """
+        timestamp = pd.Timestamp(timestamp)
+        # Check before any window changes, so a bad reading leaves no trace
+        self._check_order(station, timestamp)
+        if station not in self._stations:
+            self._stations[station] = [RollingWindow(w, self.min_periods) for w in self.windows]
+
+        stats = {}
+        for window in self._stations[station]:
+            window.update(timestamp, value)
+            stats.update(window.stats())
+        self._last_time[station] = timestamp
+        if self._latest is None or timestamp > self._latest:
+            self._latest = timestamp
+        return stats
+
+    def update_frame(self, df, station_col='Name of Structure', date_col='Date',
+                     value_col='Inflow_Discharge'):
+        """
+        Push every row of a dataframe, in time order
+
+        Rows without a parseable date are skipped and get NaN statistics.
+        The frame is rejected as a whole, before any reading is pushed, if it
+        holds readings older than the ones already seen for a station.
+
+        Returns:
+        - DataFrame aligned with df holding the statistics after each row
+        """
+        dates = pd.to_datetime(df[date_col], dayfirst=True, errors='coerce')
+        # Dashboard exports carry thousands separators, e.g. '1,085,750'
+        values = pd.to_numeric(df[value_col].astype(str).str.replace(',', ''), errors='coerce').to_numpy()
+        stations = df[station_col].to_numpy()
+
+        valid = dates.notna().to_numpy()
+        earliest = pd.Series(dates.to_numpy()[valid]).groupby(stations[valid]).min()
+        for station, timestamp in earliest.items():
+            self._check_order(station, timestamp)
+
+        # Work by position, the index of concatenated sheets is often not unique
+        dates = dates.to_numpy()
+        rows = [{} for _ in range(len(df))]
+        for pos in np.argsort(dates, kind='stable'):
+            if valid[pos]:
+                rows[pos] = self.update(stations[pos], dates[pos], values[pos])
+
+        return pd.DataFrame(rows, index=df.index)
+
+    def stations(self):
+        return list(self._stations)
+
+    def station_stats(self, station, now=None):
+        """
+        Return the statistics of one station as of now
+
+        Parameters:
+        - station: Station name
+        - now: Time to evaluate the windows at, defaults to the latest
+          reading seen across all stations, so a station that stopped
+          reporting drops out of its time windows. Querying never changes
+          the stored readings.
+        """
+        if station not in self._stations:
+            raise KeyError(f"No readings for station: {station}")
+        now = self._latest if now is None else pd.Timestamp(now)
+
+        stats = {}
+        for window in self._stations[station]:
+            stats.update(window.stats(now))
+        return stats
+
+    def snapshot(self, now=None):
+        """Return the statistics of every station as of now, one row each"""
+        now = self._latest if now is None else pd.Timestamp(now)
+
+        rows = []
+        for station in self._stations:
+            row = {'station': station, 'last_reading': self._last_time[station]}
+            row.update(self.station_stats(station, now=now))
+            rows.append(row)
+
+        return pd.DataFrame(rows)